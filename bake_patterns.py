@@ -0,0 +1,33 @@
+# bake_patterns.py
+"""
+Заранее собирает шаблоны ссылок и сохраняет их байткод в patterns.pkl
+(или в путь из PATTERNS_CACHE), чтобы сервис не компилировал их при старте.
+
+Запуск: python bake_patterns.py
+Кэш привязан к исходникам шаблонов и версии Python, поэтому собирать его нужно
+тем же интерпретатором, что и сервис (в Dockerfile — на этапе сборки).
+"""
+import json
+
+from main import (
+    LAW_ALIASES_PATH,
+    PATTERNS_CACHE_PATH,
+    bake_patterns,
+    build_alias_maps_cached,
+    logger,
+)
+
+
+def main() -> None:
+    with LAW_ALIASES_PATH.open("r", encoding="utf-8") as f:
+        codex_aliases = json.load(f)
+    _, LAW_NAMED, LAW_NONCAP, lid_group_names = build_alias_maps_cached(codex_aliases)
+    bake_patterns(LAW_NAMED, LAW_NONCAP)
+    logger.info(
+        "✅ Шаблоны сохранены в %s: %d групп законов",
+        PATTERNS_CACHE_PATH, len(lid_group_names),
+    )
+
+
+if __name__ == "__main__":
+    main()
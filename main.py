@@ -1,16 +1,24 @@
 # main.py
+import hashlib
 import json
 import logging
 import os
+import pickle
 import re
+import sys
+from array import array
+from bisect import bisect_left
 from contextlib import asynccontextmanager
 from dataclasses import dataclass
-from itertools import product
+from functools import lru_cache
+from itertools import accumulate, product
+from operator import itemgetter
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
 import uvicorn
 from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 
 # =======================
@@ -29,6 +37,16 @@ logging.basicConfig(
 )
 logger = logging.getLogger("law-links-service")
 
+# Движок для больших шаблонов ссылок: "re" (stdlib) или "regex" (пакет regex).
+# regex отпускает GIL во время поиска, поэтому параллельные /detect из пула потоков
+# занимают несколько ядер; на одном потоке он примерно вдвое медленнее re.
+REGEX_ENGINE = os.getenv("REGEX_ENGINE", "re").lower()
+
+LAW_ALIASES_PATH = Path(__file__).with_name("law_aliases.json")
+# Заранее собранные шаблоны (см. bake_patterns.py); если исходники шаблонов
+# изменились (алиасы или код сборки), пересобираются при старте и перезаписываются.
+PATTERNS_CACHE_PATH = Path(os.getenv("PATTERNS_CACHE", str(Path(__file__).with_name("patterns.pkl"))))
+
 # ==========================
 # Pydantic-модели ответа API
 # ==========================
@@ -60,6 +78,16 @@ class ParsedRef:
     subpoint: Optional[str]
 
 
+@dataclass(slots=True)
+class RawItem:
+    """Ссылка до отсева и дедупликации вместе со спаном совпадения."""
+    law_id: int
+    article: Optional[str]
+    point: Optional[str]
+    subpoint: Optional[str]
+    span: Tuple[int, int]
+
+
 # =================================
 # Нормализация и вспомогательные ф-ии
 # =================================
@@ -88,13 +116,20 @@ L2C_MAP = str.maketrans({
     "Y": "У", "y": "у",
 })
 
+# Кавычки и дефисы заменяются за один проход str.translate
+_NORMALIZE_TRANS = str.maketrans({**QUOTE_CHARS, **DASH_CHARS})
+
+_SPACES_RE = re.compile(r"[ \t]{2,}")
+_WHITESPACE_RE = re.compile(r"\s+")
+
 def normalize_text(s: str) -> str:
     """Нормализует кавычки/дефисы/пробелы (без латиница→кириллица!)."""
-    for a, b in QUOTE_CHARS.items():
-        s = s.replace(a, b)
-    for a, b in DASH_CHARS.items():
-        s = s.replace(a, b)
-    s = re.sub(r"[ \t]{2,}", " ", s)
+    # Все заменяемые кавычки/тире — не-ASCII: для ASCII-текста translate не нужен
+    if not s.isascii():
+        s = s.translate(_NORMALIZE_TRANS)
+    # [ \t]{2,} невозможен без двух пробелов подряд или хотя бы одного таба
+    if "  " in s or "\t" in s:
+        s = _SPACES_RE.sub(" ", s)
     return s
 L2C_MAP = str.maketrans({
     # латинские → кириллица (look-alikes) — только для названий законов
@@ -112,82 +147,106 @@ L2C_MAP = str.maketrans({
     "Y": "У", "y": "у",
 })
 
+# Нижний регистр для латиницы и кириллицы, символ в символ (str.lower может
+# менять длину строки, а смещения совпадений должны подходить к исходному тексту)
+_LOWER_MAP = str.maketrans(
+    "ABCDEFGHIJKLMNOPQRSTUVWXYZАБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ",
+    "abcdefghijklmnopqrstuvwxyzабвгдеёжзийклмнопрстуфхцчшщъыьэюя",
+)
+# Текст для поиска: настоящие буквы — в нижний регистр, латинские двойники —
+# в кириллицу ВЕРХНЕГО регистра. Ключевые слова, предлоги и союзы в шаблонах
+# записаны строчными и сравниваются с учётом регистра, поэтому двойники в них не
+# проходят ('fact' не станет «ст»). Названия законов обёрнуты в (?i:...) и принимают
+# и то и другое — так двойники работают только внутри алиасов.
+_MATCH_MAP = {**_LOWER_MAP, **{k: v.upper() for k, v in L2C_MAP.items()}}
+
+@lru_cache(maxsize=4096)
 def normalize_for_alias(s: str) -> str:
     """Нормализация строк именно для сопоставления названий законов."""
     s = normalize_text(s)
     s = s.translate(L2C_MAP) 
     s = s.strip().lower()
-    s = re.sub(r"\s+", " ", s)
+    s = _WHITESPACE_RE.sub(" ", s)
     return s
 
 def norm_alias_key(s: str) -> str:
     return normalize_for_alias(s)
 
 
+# Регэкспы и помощники для сборки шаблонов алиасов. Слова в алиасах сильно
+# повторяются (тысячи уникальных слов на сотни тысяч вхождений), поэтому
+# преобразования слова и алиаса мемоизируются.
+_UPPER_RU = r"[А-ЯЁ]"
+_LOWER_RU = r"[а-яё]"
+_RU_WORD_RE = re.compile(r"[А-Яа-яЁё]+")
+_CAPS_SHORT_RE = re.compile(rf"{_UPPER_RU}{{2,5}}")
+_ADJ_ENDING_RE = re.compile(r"(ый|ий|ой)$", flags=re.IGNORECASE)
+_ALIAS_SPLIT_RE = re.compile(r"(\s+)")
+
+
+def _is_all_caps_short(tok: str) -> bool:
+    # Аббревиатуры наподобие "НК", "УК", "ГПК", "КоАП" (последнее не all-caps, но короткое)
+    return bool(_CAPS_SHORT_RE.fullmatch(tok))
+
+
+@lru_cache(maxsize=8192)
+def _flex_word(tok: str) -> str:
+    """
+    Гибкое слово:
+      - 'РФ' — как есть
+      - Короткие аббревиатуры (ГПК, НК...) без хвоста '[а-яё]*'
+      - Для обычных слов — допускаем морф. окончания через '[а-яё]*'
+      - Прилагательные на -ый/-ий/-ой 
+    """
+    # Регистр нужен только для решения выше/ниже; сам шаблон — в нижнем регистре
+    low = tok.translate(_LOWER_MAP)
+    if tok.upper() == "РФ":
+        return re.escape(low)
+
+    if _is_all_caps_short(tok):
+        return re.escape(low)
+
+    if _ADJ_ENDING_RE.search(tok):
+        stem = re.escape(low[:-2])
+        return fr"{stem}{_LOWER_RU}+"
+
+    stem = re.escape(low)
+    return fr"{stem}{_LOWER_RU}*"
+
+
+@lru_cache(maxsize=4096)
+def _alias_to_pattern(alias: str) -> str:
+    # Латинские двойники кириллицы здесь не раскрываются: и алиасы, и текст перед
+    # поиском проходят через L2C_MAP, поэтому алиас компилируется чистой кириллицей
+    # в нижнем регистре. Двойники в тексте (верхний регистр после _MATCH_MAP)
+    # принимает (?i:...) вокруг всей альтернации законов в build_alias_maps.
+    alias = normalize_text(alias).translate(L2C_MAP)
+    tokens = _ALIAS_SPLIT_RE.split(alias)
+    out = []
+    for t in tokens:
+        if t.isspace():
+            out.append(r"\s+")
+        elif _RU_WORD_RE.fullmatch(t) and len(t) >= 2:
+            out.append(_flex_word(t))
+        else:
+            out.append(re.escape(t.translate(_LOWER_MAP)))
+    core = "".join(out)
+    # Жёсткие границы слова вокруг ВЕСЬ алиаса, чтоб не матчить внутри слов
+    return rf"(?<![0-9A-Za-zА-Яа-яЁё])(?:{core})(?![0-9A-Za-zА-Яа-яЁё])"
+
+
 def build_alias_maps(codex_aliases: Dict[str, List[str]]):
     """
     Возвращает:
       - alias_to_id: {нормализованный алиас -> law_id}
       - LAW_NAMED:    объединённый regex с именованными группами (?P<LID_15>...)
       - LAW_NONCAP:   тот же regex, но без именованных групп (?:...)
-      - lid_group_names: {'LID_15': 15, ...}
+      - lid_group_names: {'LID_15': 15, ...} в порядке групп в LAW_NAMED
     """
     alias_to_id: Dict[str, int] = {}
     lid_group_names: Dict[str, int] = {}
     parts: List[str] = []
-
-    LOOKALIKE = {
-        "А":"A","В":"B","Е":"E","К":"K","М":"M","Н":"H","О":"O","Р":"P","С":"C","Т":"T","Х":"X","У":"Y",
-        "а":"a","в":"b","е":"e","к":"k","м":"m","н":"h","о":"o","р":"p","с":"c","т":"t","х":"x","у":"y",
-    }
-
-    def flex_char(ch: str) -> str:
-        return f"[{re.escape(ch)}{LOOKALIKE[ch]}]" if ch in LOOKALIKE else re.escape(ch)
-
-    UPPER_RU = r"[А-ЯЁ]"
-    LOWER_RU = r"[а-яё]"
-    RU_WORD   = r"[А-Яа-яЁё]+"
-
-    def is_all_caps_short(tok: str) -> bool:
-        # Аббревиатуры наподобие "НК", "УК", "ГПК", "КоАП" (последнее не all-caps, но короткое)
-        return bool(re.fullmatch(rf"{UPPER_RU}{{2,5}}", tok))
-
-    def flex_word(tok: str) -> str:
-        """
-        Гибкое слово:
-          - 'РФ' обрабатываем посимвольно с LOOKALIKE
-          - Короткие аббревиатуры (ГПК, НК...) без хвоста '[а-яё]*'
-          - Для обычных слов — допускаем морф. окончания через '[а-яё]*'
-          - Прилагательные на -ый/-ий/-ой 
-        """
-        if tok.upper() == "РФ":
-            return "".join(flex_char(c) for c in tok)
-
-        if is_all_caps_short(tok):
-            return "".join(flex_char(c) for c in tok)
-
-        if re.search(r"(ый|ий|ой)$", tok, flags=re.IGNORECASE):
-            stem = tok[:-2]
-            stem = "".join(flex_char(c) for c in stem)
-            return fr"{stem}{LOWER_RU}+"
-
-        stem = "".join(flex_char(c) for c in tok)
-        return fr"{stem}{LOWER_RU}*"
-
-    def alias_to_pattern(alias: str) -> str:
-        alias = normalize_text(alias)
-        tokens = re.split(r"(\s+)", alias)
-        out = []
-        for t in tokens:
-            if t.isspace():
-                out.append(r"\s+")
-            elif re.fullmatch(RU_WORD, t) and len(t) >= 2:
-                out.append(flex_word(t))
-            else:
-                out.append(re.escape(t))
-        core = "".join(out)
-        # Жёсткие границы слова вокруг ВЕСЬ алиаса, чтоб не матчить внутри слов
-        return rf"(?<![0-9A-Za-zА-Яа-яЁё])(?:{core})(?![0-9A-Za-zА-Яа-яЁё])"
+    parts_noncap: List[str] = []
 
     # длинные алиасы — первыми
     all_items = []
@@ -200,18 +259,36 @@ def build_alias_maps(codex_aliases: Dict[str, List[str]]):
     by_id: Dict[int, List[str]] = {}
     for lid, alias in all_items:
         alias_to_id[normalize_for_alias(alias)] = lid
-        by_id.setdefault(lid, []).append(alias_to_pattern(alias))
+        by_id.setdefault(lid, []).append(_alias_to_pattern(alias))
 
+    # Оба варианта собираем за один проход, а не заменой групп в готовом LAW_NAMED
     for lid, patts in by_id.items():
         gname = f"LID_{lid}"
         lid_group_names[gname] = lid
-        parts.append(fr"(?P<{gname}>" + "|".join(patts) + ")")
+        body = "|".join(patts)
+        parts.append(fr"(?P<{gname}>{body})")
+        parts_noncap.append(fr"(?:{body})")
 
-    LAW_NAMED = "(?:" + "|".join(parts) + ")"
-    LAW_NONCAP = re.sub(r"\(\?P<LID_\d+>", "(?:", LAW_NAMED)
+    # Без учёта регистра — только названия законов (см. _MATCH_MAP)
+    LAW_NAMED = "(?i:" + "|".join(parts) + ")"
+    LAW_NONCAP = "(?i:" + "|".join(parts_noncap) + ")"
     return alias_to_id, LAW_NAMED, LAW_NONCAP, lid_group_names
 
 
+@lru_cache(maxsize=1)
+def _build_alias_maps_frozen(frozen_key: Tuple[Tuple[str, Tuple[str, ...]], ...]):
+    return build_alias_maps(dict(frozen_key))
+
+
+def build_alias_maps_cached(codex_aliases: Dict[str, List[str]]):
+    """
+    То же, что build_alias_maps, но с мемоизацией по содержимому словаря алиасов.
+    Порядок законов сохраняется как в исходном словаре — от него зависит
+    порядок альтернатив в LAW_NAMED.
+    """
+    frozen_key = tuple((lid, tuple(a)) for lid, a in codex_aliases.items())
+    return _build_alias_maps_frozen(frozen_key)
+
 
 # ============
 # Разбор значений
@@ -221,46 +298,43 @@ def build_alias_maps(codex_aliases: Dict[str, List[str]]):
 ATOM = r"(?:\d+(?:\.\d+)*|[«»\"'“”‘’]?[A-Za-zА-Яа-яё][»«\"'“”‘’]?)"
 
 # Разделители перечисления: запятая, точка с запятой, "и", "или", "и/или", "либо", дефис для диапазона
-VAL_CHUNK = fr"{ATOM}(?:\s*(?:,\s*|;\s*|и\s+|или\s+|и\/или\s+|либо\s+|-)\s*{ATOM})*"
+# Пробелы вокруг разделителя съедает только внешний \s*: вложенные \s* / \s+ давали
+# полиномиальный перебор разбиений одного и того же пробельного участка.
+VAL_CHUNK = fr"{ATOM}(?:\s*(?:,|;|и\s|или\s|и\/или\s|либо\s|-)\s*{ATOM})*"
+
+# Алфавиты для диапазонов букв ('а-в', 'a-c'); в русском 'ё' стоит после 'е'
+_LAT_ALPHA = "abcdefghijklmnopqrstuvwxyz"
+_RUS_ALPHA = "абвгдеёжзийклмнопрстуфхцчшщъыьэюя"
+_LAT_IDX = {c: i for i, c in enumerate(_LAT_ALPHA)}
+_RUS_IDX = {c: i for i, c in enumerate(_RUS_ALPHA)}
+# Одиночные буквы-значения (пункт 'а', подпункт 'b') в обоих регистрах
+_LETTERS = frozenset(_LAT_ALPHA + _LAT_ALPHA.upper() + _RUS_ALPHA + _RUS_ALPHA.upper())
+
+# Разделители перечисления внутри уже выделенного значения
+_VALUE_SPLIT_RE = re.compile(r"\s*(?:,|;|и\/или|либо|или|и)\s*", flags=re.IGNORECASE)
 
 def _is_letter(s: str) -> bool:
-    return bool(re.fullmatch(r"[A-Za-zА-Яа-яё]", s))
+    return s in _LETTERS
 
 def _expand_letter_range(a: str, b: str) -> List[str]:
     # Диапазон букв: поддерживаем кириллицу и латиницу
+    # Выберем алфавит по первой букве; проверка «это буква» — тот же поиск в индексе
     a0, b0 = a.lower(), b.lower()
-    if not (_is_letter(a0) and _is_letter(b0)):
+    if a0 in _LAT_IDX:
+        alpha, idx = _LAT_ALPHA, _LAT_IDX
+    elif a0 in _RUS_IDX:
+        alpha, idx = _RUS_ALPHA, _RUS_IDX
+    else:
         return [a, b]
 
-    # Выберем алфавит по первой букве
-    def is_lat(ch: str) -> bool:
-        return bool(re.fullmatch(r"[a-z]", ch))
-
-    def alphabet(ch: str) -> List[str]:
-        if is_lat(ch):
-            return [chr(c) for c in range(ord('a'), ord('z')+1)]
-        else:
-            # русская азбука без 'ё' последовательно; добавим 'ё' в нужное место
-            # Для простоты возьмём непрерывный диапазон в Unicode от 'а' до 'я' и отдельно учтём 'ё'
-            rus = [chr(c) for c in range(ord('а'), ord('я')+1)]
-            # иногда встречается 'ё' — добавим её в алфавит (поставим после 'е')
-            if 'ё' not in rus:
-                rus.insert(rus.index('е')+1, 'ё')
-            return rus
-
-    if is_lat(a0) != is_lat(b0):
-        # разные алфавиты — не расширяем
-        return [a, b]
-
-    alpha = alphabet(a0)
-    try:
-        ia, ib = alpha.index(a0), alpha.index(b0)
-    except ValueError:
+    if b0 not in idx:
+        # не буква или разные алфавиты — не расширяем
         return [a, b]
 
+    ia, ib = idx[a0], idx[b0]
     if ib < ia:
         ia, ib = ib, ia
-    return alpha[ia:ib+1]
+    return list(alpha[ia:ib+1])
 
 
 
@@ -320,10 +394,15 @@ def _split_by_commas_and_conj(s: str) -> List[str]:
     if not s:
         return []
     # одиночная буква — это значение, не союз
-    if re.fullmatch(r"[A-Za-zА-Яа-яё]", s):
+    if _is_letter(s):
         return [s]
+    # без союзов (все они содержат 'и') остаются только , и ; — хватает str.split;
+    # strip() снимает те же пробелы, что \s* вокруг разделителя в _VALUE_SPLIT_RE
+    if "и" not in s and "И" not in s:
+        parts = [p.strip() for p in s.replace(";", ",").split(",")]
+        return [p for p in parts if p]
     # обычный случай — режем по разделителям/союзам
-    parts = re.split(r"\s*(?:,|;|и\/или|либо|или|и)\s*", s, flags=re.IGNORECASE)
+    parts = _VALUE_SPLIT_RE.split(s)
     return [p for p in parts if p]
 
 
@@ -335,10 +414,27 @@ def parse_values(chunk: Optional[str], *, expand_hyphens: bool = True) -> List[s
     """
     if not chunk:
         return []
-    parts = _split_by_commas_and_conj(chunk)
+    # Быстрый путь для одиночного значения ('145', '30.1'): без , ; и 'и' (его
+    # содержит любой союз) разбиение по _VALUE_SPLIT_RE вернуло бы строку целиком.
+    s = chunk.strip()
+    if "," not in s and ";" not in s and "и" not in s and "И" not in s:
+        if not s:
+            return []
+        if not expand_hyphens or "-" not in s:
+            return [s]
+    return list(_parse_values_split(s, expand_hyphens))
+
+
+@lru_cache(maxsize=4096)
+def _parse_values_split(s: str, expand_hyphens: bool) -> Tuple[str, ...]:
+    """
+    Медленный путь parse_values: перечисления и диапазоны. Одни и те же значения
+    повторяются в перекрывающихся совпадениях и между запросами, поэтому результат
+    кэшируется (кортеж — чтобы общий результат нельзя было испортить).
+    """
     out: List[str] = []
-    for p in parts:
-        p = p.strip()
+    # Части уже без внешних пробелов: их съедает \s* вокруг разделителя в _VALUE_SPLIT_RE
+    for p in _split_by_commas_and_conj(s):
         if "-" in p and expand_hyphens:
             a, b = [q.strip() for q in p.split("-", 1)]
             if _is_letter(a) and _is_letter(b):
@@ -349,13 +445,7 @@ def parse_values(chunk: Optional[str], *, expand_hyphens: bool = True) -> List[s
             out.append(p)
 
     # Убираем дубли, сохраняя порядок
-    seen = set()
-    uniq = []
-    for v in out:
-        if v not in seen:
-            seen.add(v)
-            uniq.append(v)
-    return uniq
+    return tuple(dict.fromkeys(out))
 
 # ===========================
 # Компиляция общих шаблонов
@@ -363,86 +453,207 @@ def parse_values(chunk: Optional[str], *, expand_hyphens: bool = True) -> List[s
 
 # Ключевые слова (учитываем падежи + защищаем короткие аббревиатуры от вхождений внутрь слов)
 KW_ART  = r"(?:ст(?:атья|атьи|атье|атью|\.?)\w*)"
-KW_PNT  = r"(?:пункт\w*|(?<![А-Яа-яё])п\.)"
-KW_PART = r"(?:част\w*|(?<![А-Яа-яё])ч\.)"  
+# В тексте для поиска настоящая кириллица всегда строчная (заглавные — это
+# латинские двойники, см. _MATCH_MAP), поэтому граница слова — только [а-яё]
+KW_PNT  = r"(?:пункт\w*|(?<![а-яё])п\.)"
+KW_PART = r"(?:част\w*|(?<![а-яё])ч\.)"  
 KW_SUBP = r"(?:подпункт\w*|подп\.|пп\.)"
 
-def compile_patterns(LAW_NAMED: str, LAW_NONCAP: str) -> Dict[str, re.Pattern]:
+# Шаблоны «порядков» ссылки, которые прогоняются по тексту (без префильтра "law")
+CONTEXT_PATTERNS = ("after", "before", "mid")
+
+def _pattern_engine():
+    """Модуль, которым компилируются большие шаблоны (см. REGEX_ENGINE)."""
+    if REGEX_ENGINE == "regex":
+        import regex
+        return regex
+    return re
+
+def build_pattern_sources(LAW_NAMED: str, LAW_NONCAP: str) -> Dict[str, str]:
+    """
+    Исходники шаблонов after/before/mid/law. Все литералы в нижнем регистре:
+    шаблоны компилируются без IGNORECASE и применяются к тексту после _MATCH_MAP.
+    """
     PRE = r"(?:\b(?:в|во|на|к|ко|по|об|обо|о|от|со|с|для)\b\s*)?"
     TOK_ART    = fr"(?:{PRE}{KW_ART})"
     TOK_PNPART = fr"(?:{PRE}(?:{KW_PNT}|{KW_PART}))"
     TOK_SUBP   = fr"(?:{PRE}{KW_SUBP})"
 
-    LA_AFTER_SUBP  = fr"(?=(?:\s*[,:;]?\s*(?:{TOK_PNPART}|{TOK_ART}))|[),.;]|$)"
-    LA_AFTER_POINT = fr"(?=(?:\s*[,:;]?\s*(?:{TOK_ART}|{TOK_SUBP}))|[),.;]|$)"
+    # Необязательный разделитель записан как \s*(?:[,:;]\s*)? — см. комментарий к VAL_CHUNK
+    LA_AFTER_SUBP  = fr"(?=(?:\s*(?:[,:;]\s*)?(?:{TOK_PNPART}|{TOK_ART}))|[),.;]|$)"
+    LA_AFTER_POINT = fr"(?=(?:\s*(?:[,:;]\s*)?(?:{TOK_ART}|{TOK_SUBP}))|[),.;]|$)"
     # БЕЗ именованных групп:
-    LA_AFTER_ART   = fr"(?=(?:\s*(?:{LAW_NONCAP})|\s*[,:;]?\s*(?:{TOK_PNPART}|{TOK_SUBP})|[),.;]|$))"
+    LA_AFTER_ART   = fr"(?=(?:\s*(?:{LAW_NONCAP})|\s*(?:[,:;]\s*)?(?:{TOK_PNPART}|{TOK_SUBP})|[),.;]|$))"
 
-    patt_after = re.compile(
+    src_after = (
         fr"(?P<full>"
-        fr"(?:{TOK_SUBP}\s*(?P<subp_vals>{VAL_CHUNK}?){LA_AFTER_SUBP}\s*[;,]?\s*)?"
-        fr"(?:{TOK_PNPART}\s*(?P<point_vals>{VAL_CHUNK}?){LA_AFTER_POINT}\s*[;,]?\s*)?"
+        fr"(?:{TOK_SUBP}\s*(?P<subp_vals>{VAL_CHUNK}?){LA_AFTER_SUBP}\s*(?:[;,]\s*)?)?"
+        fr"(?:{TOK_PNPART}\s*(?P<point_vals>{VAL_CHUNK}?){LA_AFTER_POINT}\s*(?:[;,]\s*)?)?"
         fr"{TOK_ART}\s*(?P<article_vals>{VAL_CHUNK}?){LA_AFTER_ART}\s*"
         fr"(?P<law>{LAW_NAMED})"  
-        fr")",
-        flags=re.IGNORECASE
+        fr")"
     )
 
-    patt_before = re.compile(
+    src_before = (
         fr"(?P<full>"
-        fr"(?P<law>{LAW_NAMED})\s*[,:;]?\s*"
+        fr"(?P<law>{LAW_NAMED})\s*(?:[,:;]\s*)?"
         fr"{TOK_ART}\s*(?P<article_vals>{VAL_CHUNK}?){LA_AFTER_ART}"
-        fr"(?:\s*[,:;]?\s*{TOK_PNPART}\s*(?P<point_vals>{VAL_CHUNK}?){LA_AFTER_POINT})?"
-        fr"(?:\s*[,:;]?\s*{TOK_SUBP}\s*(?P<subp_vals>{VAL_CHUNK}?)(?=(?:\s*[),.;])|$))?"
-        fr")",
-        flags=re.IGNORECASE
+        fr"(?:\s*(?:[,:;]\s*)?{TOK_PNPART}\s*(?P<point_vals>{VAL_CHUNK}?){LA_AFTER_POINT})?"
+        fr"(?:\s*(?:[,:;]\s*)?{TOK_SUBP}\s*(?P<subp_vals>{VAL_CHUNK}?)(?=(?:\s*[),.;])|$))?"
+        fr")"
     )
 
-    patt_mid = re.compile(
+    src_mid = (
         fr"(?P<full>"
-        fr"{TOK_PNPART}\s*(?P<point_vals>{VAL_CHUNK}?){LA_AFTER_POINT}\s*[;,]?\s*"
+        fr"{TOK_PNPART}\s*(?P<point_vals>{VAL_CHUNK}?){LA_AFTER_POINT}\s*(?:[;,]\s*)?"
         fr"{TOK_ART}\s*(?P<article_vals>{VAL_CHUNK}?){LA_AFTER_ART}\s*"
         fr"(?P<law>{LAW_NAMED})"
-        fr")",
-        flags=re.IGNORECASE
+        fr")"
     )
 
-    return {"after": patt_after, "before": patt_before, "mid": patt_mid}
+    # Префильтр: голое название закона. Любая ссылка его содержит, поэтому если
+    # алиасов в тексте нет, контекстные шаблоны можно не запускать вовсе.
+    return {"after": src_after, "before": src_before, "mid": src_mid, "law": LAW_NONCAP}
 
+@lru_cache(maxsize=4)
+def compile_patterns(LAW_NAMED: str, LAW_NONCAP: str) -> Dict[str, re.Pattern]:
+    """Компилирует шаблоны; результат кэшируется по исходникам (строки хэшируемы)."""
+    engine = _pattern_engine()
+    return {
+        key: engine.compile(src)
+        for key, src in build_pattern_sources(LAW_NAMED, LAW_NONCAP).items()
+    }
 
 
+# ==================================
+# Заранее собранные шаблоны (кэш)
+# ==================================
+# Почти всё время старта уходит на разбор и генерацию байткода re для шаблонов
+# с тысячами алиасов (минуты), а сама сборка объекта Pattern из готового байткода —
+# доли секунды. Скомпилированный Pattern pickle сохраняет только исходник и при
+# загрузке компилирует заново, поэтому в кэш кладём сам байткод _sre.
+# Кэш привязан к исходникам шаблонов (sha256), версии Python и _sre.MAGIC и
+# используется только с движком "re".
+
+def _cache_header(sources: Dict[str, str]) -> Dict:
+    import _sre
+    h = hashlib.sha256()
+    for key, src in sources.items():
+        h.update(f"{key}\0{src}\0".encode("utf-8"))
+    return {"sources_sha256": h.hexdigest(), "python": tuple(sys.version_info[:2]), "sre_magic": _sre.MAGIC}
+
+def _sre_compile_args(src: str, flags: int) -> Tuple:
+    """Аргументы _sre.compile — то же, что делает re.compile, без обращения к кэшу re."""
+    from re import _compiler, _parser
+    p = _parser.parse(src, flags)
+    code = _compiler._code(p, flags)
+    groupindex = p.state.groupdict
+    indexgroup = [None] * p.state.groups
+    for name, i in groupindex.items():
+        indexgroup[i] = name
+    return (src, flags | p.state.flags, code, p.state.groups - 1, groupindex, tuple(indexgroup))
+
+def _sre_from_args(args: Tuple) -> re.Pattern:
+    import _sre
+    src, flags, code, groups, groupindex, indexgroup = args
+    return _sre.compile(src, flags, code, groups, groupindex, indexgroup)
+
+def bake_patterns(
+    LAW_NAMED: str, LAW_NONCAP: str, path: Path = PATTERNS_CACHE_PATH
+) -> Dict[str, re.Pattern]:
+    """
+    Компилирует шаблоны (как compile_patterns) и сохраняет их байткод в path.
+    Если внутренний API re/_sre недоступен (Python до 3.11, другая сигнатура
+    _sre.compile), просто компилирует через compile_patterns без кэша.
+    """
+    sources = build_pattern_sources(LAW_NAMED, LAW_NONCAP)
+    baked: Dict[str, Tuple] = {}
+    patterns: Dict[str, re.Pattern] = {}
+    try:
+        for key, src in sources.items():
+            args = _sre_compile_args(src, 0)
+            patterns[key] = _sre_from_args(args)
+            baked[key] = (*args[:2], array("I", args[2]).tobytes(), *args[3:])
+        header = _cache_header(sources)
+    except (ImportError, AttributeError, TypeError) as e:
+        logger.warning("Байткод шаблонов недоступен (%s), компилируем без кэша", e)
+        return compile_patterns(LAW_NAMED, LAW_NONCAP)
+
+    payload = {**header, "patterns": baked}
+    try:
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        with tmp.open("wb") as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning("Не удалось сохранить кэш шаблонов %s: %s", path, e)
+    return patterns
+
+def load_baked_patterns(
+    LAW_NAMED: str, LAW_NONCAP: str, path: Path = PATTERNS_CACHE_PATH
+) -> Optional[Dict[str, re.Pattern]]:
+    """
+    Загружает шаблоны, сохранённые bake_patterns. None — если кэша нет, он собран
+    из других исходников шаблонов/другой версией Python или не читается.
+    """
+    if not path.exists():
+        return None
+    try:
+        with path.open("rb") as f:
+            payload = pickle.load(f)
+        header = _cache_header(build_pattern_sources(LAW_NAMED, LAW_NONCAP))
+        if any(payload.get(k) != v for k, v in header.items()):
+            logger.info("Кэш шаблонов %s устарел, пересобираем", path)
+            return None
+        patterns = {}
+        for key, (src, flags, code, *rest) in payload["patterns"].items():
+            patterns[key] = _sre_from_args((src, flags, array("I", code).tolist(), *rest))
+        return patterns
+    except Exception as e:
+        logger.warning("Не удалось загрузить кэш шаблонов %s: %s", path, e)
+        return None
+
 
-def spans_overlap(a: Tuple[int, int], b: Tuple[int, int]) -> bool:
-    # Перекрываются, если один не полностью "до" другого
-    return not (a[1] <= b[0] or b[1] <= a[0])
 
 
-def prune_less_specific(items: List[dict]) -> List[dict]:
+def prune_less_specific(items: List[RawItem]) -> List[RawItem]:
     """
     Удаляет записи без subpoint, если в том же текстовом интервале
     (пересекающиеся спаны) уже есть записи с тем же (law_id, article, point)
     и НЕНУЛЕВЫМ subpoint.
     """
-    # Группируем по (law_id, article, point)
-    groups: Dict[Tuple[int, Optional[str], Optional[str]], List[dict]] = {}
-    for it in items:
-        key = (it["law_id"], it["article"], it["point"])
-        groups.setdefault(key, []).append(it)
-
-    to_drop = set()
-    for key, arr in groups.items():
-        with_sub = [x for x in arr if x["subpoint"] is not None]
-        no_sub = [x for x in arr if x["subpoint"] is None]
-        if not with_sub or not no_sub:
+    # Без подпунктов удалять нечего — обычный случай, группировка не нужна
+    if all(it.subpoint is None for it in items):
+        return items
+
+    # Группируем индексы записей по (law_id, article, point)
+    groups: Dict[Tuple[int, Optional[str], Optional[str]], List[int]] = {}
+    for i, it in enumerate(items):
+        key = (it.law_id, it.article, it.point)
+        groups.setdefault(key, []).append(i)
+
+    # drop[i] == 1 — запись items[i] удаляется
+    drop = bytearray(len(items))
+    for idxs in groups.values():
+        if len(idxs) == 1:
             continue
-        # если есть перекрытие спанов между записями с subpoint и без — удаляем без subpoint
-        for a in no_sub:
-            for b in with_sub:
-                if spans_overlap(a["span"], b["span"]):
-                    to_drop.add(id(a))
-                    break
+        with_sub = sorted(items[i].span for i in idxs if items[i].subpoint is not None)
+        if not with_sub or len(with_sub) == len(idxs):
+            continue
+        # Спаны с subpoint отсортированы по началу; max_ends[i] — наибольший конец
+        # среди первых i+1 из них. Спан [st, en) без subpoint перекрывается с каким-то
+        # из них, если среди начинающихся раньше en есть заканчивающийся после st.
+        starts = [st for st, _ in with_sub]
+        max_ends = list(accumulate((en for _, en in with_sub), max))
+        for i in idxs:
+            if items[i].subpoint is not None:
+                continue
+            st, en = items[i].span
+            j = bisect_left(starts, en)
+            if j and max_ends[j - 1] > st:
+                drop[i] = 1
 
-    return [x for x in items if id(x) not in to_drop]
+    return [x for x, d in zip(items, drop) if not d]
 
 
 
@@ -450,19 +661,43 @@ def prune_less_specific(items: List[dict]) -> List[dict]:
 # Основной распознаватель
 # ===========================
 
-def extract_law_id_from_match(m: re.Match, lid_group_names: Dict[str, int]) -> Optional[int]:
-    gd = m.groupdict()
-    for name, lid in lid_group_names.items():
-        if gd.get(name):
-            return lid
-    return None
+def extract_law_id_from_match(
+    m: re.Match, lids: Tuple[int, ...], law_idx: Optional[int] = None
+) -> Optional[int]:
+    """
+    lids — law_id в порядке групп LID_* (то есть tuple(lid_group_names.values())).
+    law_idx — номер группы law; если не передан, берётся из m.re.groupindex.
+
+    Группы LID_* идут подряд сразу за группой law, и участвует ровно одна из них —
+    с тем же текстом, что и law. Ищем её через tuple.index по m.groups(), не строя
+    groupdict() на сотни групп.
+    """
+    if law_idx is None:
+        law_idx = m.re.groupindex["law"]
+    groups = m.groups()  # groups[i - 1] — группа номер i
+    law_text = groups[law_idx - 1]
+    if law_text is None:
+        return None
+    # LID-группы имеют номера law_idx+1 .. law_idx+len(lids) → позиции law_idx .. в groups
+    pos = groups.index(law_text, law_idx, law_idx + len(lids))
+    return lids[pos - law_idx]
 
 from itertools import product
 import re
 from typing import Dict, List, Optional
 
+_VALUE_GROUPS = ("article_vals", "point_vals", "subp_vals")
+# Заглушка для уровня без значений (общий кортеж вместо нового [None] на каждое совпадение)
+_NONE_LIST: Tuple[None] = (None,)
+
+def _group_text(m: re.Match, text: str, idx: Optional[int]) -> Optional[str]:
+    """Значение группы номер idx, вырезанное из text по её смещениям (None — группы нет)."""
+    if idx is None:
+        return None
+    st, en = m.span(idx)
+    return text[st:en] if st >= 0 else None
+
 _NUMERIC_POINT_RE = re.compile(r"^\d+(?:\.\d+)*$")
-_SINGLE_LETTER_RE = re.compile(r"^[A-Za-zА-Яа-яё]$")
 
 def _is_numeric_point(value: Optional[str]) -> bool:
     """Пункт/часть должны быть числовыми (разрешаем 3, 3.4, 10.1.2). None — ок."""
@@ -472,75 +707,95 @@ def _is_numeric_point(value: Optional[str]) -> bool:
 
 def detect_links(
     text: str,
-    codex_aliases: Dict[str, List[str]],
+    patterns: Dict[str, re.Pattern],
+    lid_group_names: Dict[str, int],
 ) -> List["ParsedRef"]:
     """
     Извлекает юридические ссылки из текста.
 
+    patterns и lid_group_names строятся один раз при старте
+    (build_alias_maps_cached + compile_patterns) и переиспользуются между запросами.
+
     Ключевые решения:
       - Статьи НЕ разворачиваем по дефисам (например, '51.8-7' остаётся как есть),
         чтобы совпадать с эталонными тестами.
       - Пункты и подпункты разворачиваем (диапазоны/перечисления поддерживаются).
       - Буквенные пункты допустимы (например, 'п. с').
     """
-    # 1) Нормализация и подготовка шаблонов
+    # 1) Нормализация (шаблоны уже скомпилированы). Поиск идёт по тексту, где
+    #    буквы переведены в нижний регистр, а латинские двойники — в заглавную
+    #    кириллицу (см. _MATCH_MAP); замена 1:1, поэтому смещения совпадений годятся и для text_norm, откуда
+    #    берутся значения (в исходном регистре).
     text_norm = normalize_text(text)
-    _, LAW_NAMED, LAW_NONCAP, lid_group_names = build_alias_maps(codex_aliases)
-    pats = compile_patterns(LAW_NAMED, LAW_NONCAP)
+    text_match = text_norm.translate(_MATCH_MAP)
+    # Каждый шаблон порядка требует TOK_ART, а KW_ART начинается с литерала «ст»
+    # (строчного, то есть из настоящей кириллицы, а не двойников):
+    # без него ссылок нет, и даже префильтр по алиасам запускать незачем.
+    if "ст" not in text_match:
+        return []
+    first_law = patterns["law"].search(text_match)
+    if first_law is None:
+        return []
 
-    # 2) Собираем все совпадения из разных «порядков»
-    matches: List[Tuple[int, int, re.Match]] = []
-    for patt in pats.values():
-        for m in patt.finditer(text_norm):
-            matches.append((m.start(), m.end(), m))
-    matches.sort(key=lambda t: (t[0], t[1]))
+    lids = tuple(lid_group_names.values())
+
+    # 2) Собираем все совпадения из разных «порядков».
+    # Проходы намеренно раздельные: совпадения разных порядков могут перекрываться
+    # (одно название закона закрывает и «ст. 1 НК РФ», и «НК РФ, ст. 2»), а finditer
+    # по общей альтернации вернул бы только непересекающиеся совпадения.
+    # Зато «before» начинается с названия закона, поэтому его можно искать только
+    # с первого алиаса, найденного префильтром (lookbehind видит текст и до pos).
+    scan_from = {"after": 0, "before": first_law.start(), "mid": 0}
+    # Номера групп разрешаем один раз на шаблон, а не по имени на каждое совпадение.
+    matches: List[Tuple[int, int, re.Match, int, Tuple[Optional[int], ...]]] = []
+    for key in CONTEXT_PATTERNS:
+        patt = patterns[key]
+        gi = patt.groupindex
+        law_idx = gi["law"]
+        val_idx = tuple(gi.get(name) for name in _VALUE_GROUPS)
+        for m in patt.finditer(text_match, scan_from[key]):
+            matches.append((m.start(), m.end(), m, law_idx, val_idx))
+    # Каждый поток finditer уже упорядочен: timsort находит эти три серии и сливает
+    # их за линейное время, быстрее, чем heapq.merge на уровне Python.
+    matches.sort(key=itemgetter(0, 1))
 
     # 3) Преобразуем совпадения в сырые элементы
-    raw_items: List[Dict] = []
-    for st, en, m in matches:
-        law_id = extract_law_id_from_match(m, lid_group_names)
+    raw_items: List[RawItem] = []
+    for st, en, m, law_idx, (art_idx, pnt_idx, sub_idx) in matches:
+        law_id = extract_law_id_from_match(m, lids, law_idx)
         if law_id is None:
             continue
 
-        gd = m.groupdict()
         # ВАЖНО: статьи НЕ разворачиваем (expand_hyphens=False),
         # пункты/подпункты — разворачиваем.
-        art_vals = parse_values(gd.get("article_vals"), expand_hyphens=False)
-        pnt_vals = parse_values(gd.get("point_vals"),   expand_hyphens=True)
-        sub_vals = parse_values(gd.get("subp_vals"),    expand_hyphens=True)
+        art_vals = parse_values(_group_text(m, text_norm, art_idx), expand_hyphens=False)
+        pnt_vals = parse_values(_group_text(m, text_norm, pnt_idx), expand_hyphens=True)
+        sub_vals = parse_values(_group_text(m, text_norm, sub_idx), expand_hyphens=True)
 
-        arts = art_vals or [None]
-        pnts = pnt_vals or [None]
-        subs = sub_vals or [None]
+        arts = art_vals or _NONE_LIST
+        pnts = pnt_vals or _NONE_LIST
+        subs = sub_vals or _NONE_LIST
+
+        # Обычный случай — по одному значению на уровень: без product
+        if len(arts) == len(pnts) == len(subs) == 1:
+            raw_items.append(RawItem(law_id, arts[0], pnts[0], subs[0], (st, en)))
+            continue
 
+        # Декартово произведение, а не попарное сопоставление: каждая LawLink указывает
+        # на один фрагмент закона, и «подпункты а, б пункта 3, 23» — это а и б
+        # в каждом из пунктов. Если перечисление только в одном уровне, произведение
+        # и так даёт ровно по одной ссылке на значение.
         for a, p, s in product(arts, pnts, subs):
-            raw_items.append({
-                "law_id": law_id,
-                "article": a,
-                "point": p,
-                "subpoint": s,
-                "span": (st, en),
-            })
+            raw_items.append(RawItem(law_id, a, p, s, (st, en)))
 
     # 4) Удаляем менее специфичные записи (без подпункта рядом с теми же law/art/point)
     raw_items = prune_less_specific(raw_items)
 
-    # 5) Дедупликация с сохранением порядка
-    seen = set()
-    result: List[ParsedRef] = []
-    for it in raw_items:
-        key = (it["law_id"], it["article"], it["point"], it["subpoint"])
-        if key in seen:
-            continue
-        seen.add(key)
-        result.append(ParsedRef(
-            law_id=it["law_id"],
-            article=it["article"],
-            point=it["point"],
-            subpoint=it["subpoint"],
-        ))
-
-    return result
+    # 5) Дедупликация с сохранением порядка (ключ совпадает с порядком полей ParsedRef)
+    keys = dict.fromkeys(
+        (it.law_id, it.article, it.point, it.subpoint) for it in raw_items
+    )
+    return [ParsedRef(*key) for key in keys]
 
 
 # ============================
@@ -551,20 +806,36 @@ def detect_links(
 async def lifespan(app: FastAPI):
     # Startup
     try:
-        law_path = Path(__file__).with_name("law_aliases.json")
-        with law_path.open("r", encoding="utf-8") as f:
+        with LAW_ALIASES_PATH.open("r", encoding="utf-8") as f:
             codex_aliases = json.load(f)
-        app.state.codex_aliases = codex_aliases
         logger.info("✅ Загружены алиасы законов: %d законов", len(codex_aliases))
     except Exception as e:
         logger.exception("Не удалось загрузить law_aliases.json: %s", e)
         raise
 
+    # Алиасы и шаблоны строим один раз на весь жизненный цикл процесса.
+    # С движком re берём байткод из кэша (bake_patterns.py), если он собран из
+    # тех же исходников шаблонов; иначе компилируем заново и обновляем кэш.
+    alias_map, LAW_NAMED, LAW_NONCAP, lid_group_names = build_alias_maps_cached(codex_aliases)
+    if REGEX_ENGINE == "re":
+        patterns = load_baked_patterns(LAW_NAMED, LAW_NONCAP)
+        if patterns is None:
+            patterns = bake_patterns(LAW_NAMED, LAW_NONCAP)
+    else:
+        patterns = compile_patterns(LAW_NAMED, LAW_NONCAP)
+    app.state.alias_map = alias_map
+    app.state.lid_group_names = lid_group_names
+    app.state.patterns = patterns
+    logger.info(
+        "✅ Скомпилированы шаблоны (%s): %d групп законов",
+        _pattern_engine().__name__, len(lid_group_names),
+    )
+
     # Автосамотесты (без HTTP), чтобы сразу увидеть, что парсер живой
     if RUN_STARTUP_SELFTESTS:
         try:
             logger.info("🧪 Запуск стартовых тестов...")
-            _run_self_tests(codex_aliases)
+            _run_self_tests(app.state.patterns, app.state.lid_group_names)
             logger.info("🧪 Тесты завершены.")
         except Exception as e:
             logger.exception("Самотесты завершились с ошибкой: %s", e)
@@ -572,15 +843,20 @@ async def lifespan(app: FastAPI):
     yield
 
     # Shutdown
-    try:
-        del app.state.codex_aliases
-    except Exception:
-        pass
+    for attr in ("alias_map", "lid_group_names", "patterns"):
+        try:
+            delattr(app.state, attr)
+        except Exception:
+            pass
     logger.info("🛑 Сервис завершается...")
 
 
-def get_codex_aliases(request: Request) -> Dict[str, List[str]]:
-    return request.app.state.codex_aliases
+def get_patterns(request: Request) -> Dict[str, re.Pattern]:
+    return request.app.state.patterns
+
+
+def get_lid_group_names(request: Request) -> Dict[str, int]:
+    return request.app.state.lid_group_names
 
 
 app = FastAPI(
@@ -588,6 +864,7 @@ app = FastAPI(
     description="Сервис для выделения юридических ссылок из текста",
     version="1.0.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 
@@ -596,27 +873,32 @@ async def health_check():
     return {"status": "healthy"}
 
 
+# Обычный def, а не async: FastAPI выполняет такой обработчик в пуле потоков,
+# и долгий разбор текста не блокирует event loop (например, /health).
 @app.post("/detect", response_model=LinksResponse)
-async def detect_endpoint(
+def detect_endpoint(
     data: TextRequest,
-    codex_aliases: Dict[str, List[str]] = Depends(get_codex_aliases),
+    patterns: Dict[str, re.Pattern] = Depends(get_patterns),
+    lid_group_names: Dict[str, int] = Depends(get_lid_group_names),
 ):
     text = data.text or ""
     try:
-        refs = detect_links(text, codex_aliases)
+        refs = detect_links(text, patterns, lid_group_names)
         # Логируем, но аккуратно (не спамим при больших текстах)
         logger.info("Обнаружено ссылок: %d", len(refs))
-        # Подготовим ответ
+        # Подготовим ответ. Типы полей гарантирует detect_links, поэтому отдаём
+        # готовый ORJSONResponse: FastAPI не валидирует и не сериализует его повторно,
+        # а response_model остаётся описанием схемы для OpenAPI.
         links = [
-            LawLink(
-                law_id=r.law_id,
-                article=r.article if r.article is not None else None,
-                point_article=r.point if r.point is not None else None,
-                subpoint_article=r.subpoint if r.subpoint is not None else None,
-            )
+            {
+                "law_id": r.law_id,
+                "article": r.article,
+                "point_article": r.point,
+                "subpoint_article": r.subpoint,
+            }
             for r in refs
         ]
-        return LinksResponse(links=links)
+        return ORJSONResponse({"links": links})
     except Exception as e:
         logger.exception("Ошибка /detect: %s", e)
         # Возвращаем 500, чтобы явно показать сбой
@@ -627,7 +909,7 @@ async def detect_endpoint(
 # Тесты (локальные кейсы)
 # ============================
 
-def _run_self_tests(codex_aliases: Dict[str, List[str]]) -> None:
+def _run_self_tests(patterns: Dict[str, re.Pattern], lid_group_names: Dict[str, int]) -> None:
     """Мини-набор быстрых smoke-тестов парсера."""
     tests = [
         # Ожидается 3 ссылки с subpoint 1/2/3
@@ -648,10 +930,12 @@ def _run_self_tests(codex_aliases: Dict[str, List[str]]) -> None:
         # Подпункты с буквами и перечислением пунктов
         ("в подпунктах а, б и в пункта 3.345, 23 в статье 66 НК РФ",
          {"expect_min_count": 3, "expect_article": "66"}),
+        # Латинские буквы не образуют ключевых слов: «fact» — не «ст»
+        ("fact 12 УК РФ", {"expect_count": 0}),
     ]
 
     for text, expectations in tests:
-        refs = detect_links(text, codex_aliases)
+        refs = detect_links(text, patterns, lid_group_names)
         logger.debug("TEST: %s -> %s", text, refs)
         if "expect_count" in expectations:
             assert len(refs) == expectations["expect_count"], f"Ожидали {expectations['expect_count']}, получили {len(refs)}"